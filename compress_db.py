@@ -1,11 +1,21 @@
 import os
+import shutil
 import sqlite3
 import zipfile
+import subprocess
 from datetime import datetime
 
+try:
+    import zstandard
+except ImportError:  # optional; fall back to zip
+    zstandard = None
+
 DB_PATH = 'quran_arabic.db'
 OPTIMIZED_DB = 'quran_arabic.optimized.db'
 ZIP_PATH = 'quran_arabic.db.zip'
+ZST_PATH = 'quran_arabic.db.zst'
+# Larger pages pack short text rows more densely; kept only if it wins
+PAGE_SIZE = 8192
 
 
 def human(n: int) -> str:
@@ -16,6 +26,49 @@ def human(n: int) -> str:
     return f"{n:.1f} TB"
 
 
+def vacuum_with_page_size(db_path: str, out_path: str, page_size: int = PAGE_SIZE) -> None:
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f'PRAGMA page_size={page_size}')
+        conn.execute(f"VACUUM INTO '{out_path}'")
+    finally:
+        conn.close()
+
+
+def fsync_file(path: str) -> None:
+    # Writable handle: os.fsync fails with EBADF on a read-only one on Windows
+    with open(path, 'r+b') as f:
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path: str) -> None:
+    """Persist a rename into the directory containing path (POSIX only)."""
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def freeze_db(db_path: str) -> None:
+    """Prepare a read-only distribution copy: no WAL, no side files, stamped user_version."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('PRAGMA journal_mode=DELETE')
+        # Build date as a version clients can compare (e.g. 20250811)
+        conn.execute(f"PRAGMA user_version={datetime.now().strftime('%Y%m%d')}")
+        conn.commit()
+    finally:
+        conn.close()
+    for suffix in ('-wal', '-shm', '-journal'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
 def compact_db(db_path: str = DB_PATH) -> str | None:
     if not os.path.exists(db_path):
         print(f"DB not found: {db_path}")
@@ -29,27 +82,47 @@ def compact_db(db_path: str = DB_PATH) -> str | None:
     cur.execute('PRAGMA optimize')
     conn.commit()
 
-    # Try to write an optimized copy without touching the original file
+    # Try to write an optimized copy without touching the original file.
+    # Build it under a temp name and rename at the end so a crash never leaves
+    # a partial OPTIMIZED_DB behind for make_zip/make_zst to pick up.
+    tmp = OPTIMIZED_DB + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
     try:
-        cur.execute(f"VACUUM INTO '{OPTIMIZED_DB}'")
+        cur.execute(f"VACUUM INTO '{tmp}'")
         conn.commit()
-        print(f"Wrote optimized copy: {OPTIMIZED_DB}")
-        return OPTIMIZED_DB
+        vacuumed_into = True
     except sqlite3.DatabaseError as e:
         print(f"VACUUM INTO unsupported ({e}); attempting in-place VACUUM...")
-        try:
-            cur.execute('VACUUM')
-            conn.commit()
-            print("In-place VACUUM completed.")
-        finally:
-            conn.close()
-        # In-place, so return the same path
-        return db_path
+        cur.execute('VACUUM')
+        conn.commit()
+        print("In-place VACUUM completed.")
+        vacuumed_into = False
     finally:
+        conn.close()
+
+    if vacuumed_into:
+        # Try a larger page size and keep whichever copy is smaller
+        resized = f"{OPTIMIZED_DB}.{PAGE_SIZE}.tmp"
         try:
-            conn.close()
-        except Exception:
-            pass
+            vacuum_with_page_size(db_path, resized)
+            if os.path.getsize(resized) < os.path.getsize(tmp):
+                os.replace(resized, tmp)
+                print(f"Using page_size={PAGE_SIZE} copy (smaller).")
+            else:
+                os.remove(resized)
+        except sqlite3.DatabaseError as e:
+            print(f"page_size={PAGE_SIZE} rebuild failed ({e}); keeping default copy.")
+    else:
+        # Copy the vacuumed DB so the working file is never frozen in place
+        shutil.copyfile(db_path, tmp)
+
+    freeze_db(tmp)
+    fsync_file(tmp)
+    os.replace(tmp, OPTIMIZED_DB)
+    fsync_dir(OPTIMIZED_DB)
+    print(f"Wrote optimized copy: {OPTIMIZED_DB}")
+    return OPTIMIZED_DB
 
 
 def make_zip(file_to_zip: str, zip_path: str = ZIP_PATH) -> str:
@@ -64,6 +137,20 @@ def make_zip(file_to_zip: str, zip_path: str = ZIP_PATH) -> str:
     return zip_path
 
 
+def make_zst(file_to_compress: str, zst_path: str = ZST_PATH) -> str:
+    if not os.path.exists(file_to_compress):
+        raise FileNotFoundError(file_to_compress)
+    if zstandard is None:
+        # No Python bindings: use the zstd CLI, also on all cores
+        subprocess.run(['zstd', '-19', '-T0', '-q', '-f', file_to_compress, '-o', zst_path], check=True)
+        return zst_path
+    # threads=-1 compresses frames in parallel on all cores
+    cctx = zstandard.ZstdCompressor(level=19, threads=-1, write_content_size=True)
+    with open(file_to_compress, 'rb') as src, open(zst_path, 'wb') as dst:
+        cctx.copy_stream(src, dst, size=os.path.getsize(file_to_compress))
+    return zst_path
+
+
 def main() -> None:
     original_size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
     print(f"Original DB size: {human(original_size)}")
@@ -75,11 +162,19 @@ def main() -> None:
     opt_size = os.path.getsize(optimized)
     print(f"Optimized file: {optimized} ({human(opt_size)})")
 
-    # Choose the smaller file for zipping
-    candidate = optimized if opt_size and opt_size < original_size else DB_PATH
-    zip_file = make_zip(candidate)
-    zip_size = os.path.getsize(zip_file)
-    print(f"Created zip: {zip_file} ({human(zip_size)}) from {os.path.basename(candidate)}")
+    # Always ship the frozen copy: the working DB is in WAL mode and unstamped
+    candidate = optimized
+    if opt_size >= original_size:
+        print("Note: optimized copy is not smaller than the working DB; archiving it anyway.")
+    if zstandard is not None or shutil.which('zstd'):
+        archive = make_zst(candidate)
+        kind = 'zst'
+    else:
+        print("zstandard not available; falling back to zip.")
+        archive = make_zip(candidate)
+        kind = 'zip'
+    archive_size = os.path.getsize(archive)
+    print(f"Created {kind}: {archive} ({human(archive_size)}) from {os.path.basename(candidate)}")
 
     # Tips for distribution
     wal = DB_PATH + '-wal'
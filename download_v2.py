@@ -1,17 +1,27 @@
 import os
 import json
 import time
-import threading
-import requests
+import queue
+import asyncio
 import sqlite3
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import threading
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # optional; stdlib parser is slower but equivalent
+    json_loads = json.loads
 
 BASE_AUDIO = 'https://verses.quran.foundation/'
 
 DB_PATH = 'quran_arabic.db'
 
+# Fetched suras waiting for the writer thread, and rows per staging flush
+QUEUE_SIZE = 16
+STAGE_BATCH = 500
+
 
 def combine_url(path: str | None) -> str | None:
     if not path:
@@ -20,32 +30,72 @@ def combine_url(path: str | None) -> str | None:
     return BASE_AUDIO.rstrip('/') + '/' + path.lstrip('/')
 
 
-def make_session() -> requests.Session:
-    s = requests.Session()
-    retry = Retry(
-        total=5,
-        read=5,
-        connect=5,
-        backoff_factor=0.5,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset(["GET"]),
-        raise_on_status=False,
+# Retry policy for transient errors/rate limits
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+RETRY_AFTER_STATUSES = frozenset((429, 503))
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+
+
+def make_client(max_connections: int = 8) -> httpx.AsyncClient:
+    # HTTP/2 multiplexes many requests over a few connections
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=max_connections),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        headers={'User-Agent': 'QuranFetcher/2.0 (+https://api.quran.com)'},
     )
-    adapter = HTTPAdapter(
-        max_retries=retry, pool_connections=100, pool_maxsize=100)
-    s.mount('https://', adapter)
-    s.mount('http://', adapter)
-    s.headers.update(
-        {'User-Agent': 'QuranFetcher/2.0 (+https://api.quran.com)'})
-    return s
 
 
-def ensure_base_tables(conn: sqlite3.Connection) -> None:
+def retry_after(resp: httpx.Response) -> float | None:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any."""
+    value = resp.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+async def get_json(client: httpx.AsyncClient, url: str) -> dict:
+    for attempt in range(MAX_RETRIES + 1):
+        delay = BACKOFF_FACTOR * (2 ** attempt)
+        try:
+            resp = await client.get(url)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                resp.raise_for_status()
+                return json_loads(resp.content)
+            # Like urllib3's Retry, let the server pick the wait on 429/503
+            if resp.status_code in RETRY_AFTER_STATUSES:
+                wait = retry_after(resp)
+                if wait is not None:
+                    delay = wait
+        await asyncio.sleep(delay)
+
+
+def configure_pragmas(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
     cur.execute('PRAGMA journal_mode=WAL')
     cur.execute('PRAGMA synchronous=NORMAL')
     cur.execute('PRAGMA temp_store=MEMORY')
-    cur.execute('PRAGMA cache_size=-100000')
+    cur.execute('PRAGMA cache_size=-100000')  # ~100MB cache
+    cur.execute('PRAGMA mmap_size=1073741824')  # map up to 1GB
+    cur.execute('PRAGMA busy_timeout=5000')
+
+
+def ensure_base_tables(conn: sqlite3.Connection) -> None:
+    configure_pragmas(conn)
+    cur = conn.cursor()
 
     # Base tables if missing
     cur.execute('''
@@ -112,97 +162,252 @@ def recreate_ayats_words(conn: sqlite3.Connection) -> None:
         audio_url TEXT,
         FOREIGN KEY (ayat_id) REFERENCES Ayats(ayat_id)
     )''')
+    conn.commit()
+
 
-    # Indexes
+def create_ayats_words_indexes(conn: sqlite3.Connection) -> None:
+    # Built once over the populated tables instead of maintained per inserted row
+    cur = conn.cursor()
     cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_sura ON Ayats(sura_id)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_juz ON Ayats(juz_id)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_hezb ON Ayats(hezb_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_juz_page ON Ayats(juz_id, page_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_hezb_page ON Ayats(hezb_id, page_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_page ON Ayats(page_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_word_ayat ON Words(ayat_id)')
     conn.commit()
 
 
-tl = threading.local()
+def create_staging_tables(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    # Rows land here as suras arrive; ids are assigned once everything is fetched
+    cur.execute('''
+    CREATE TEMP TABLE stage_ayats (
+        ayat_id INTEGER,
+        sura_id INTEGER NOT NULL,
+        ayat_number INTEGER NOT NULL,
+        text_uthmani TEXT NOT NULL,
+        juz_id INTEGER,
+        hezb_id INTEGER,
+        page_id INTEGER,
+        sajdah_number INTEGER,
+        audio_url TEXT,
+        PRIMARY KEY (sura_id, ayat_number)
+    )''')
+    cur.execute('''
+    CREATE TEMP TABLE stage_words (
+        sura_id INTEGER NOT NULL,
+        ayat_number INTEGER NOT NULL,
+        word_number INTEGER,
+        text_uthmani TEXT NOT NULL,
+        type TEXT NOT NULL,
+        page_number INTEGER,
+        line_number INTEGER,
+        audio_url TEXT
+    )''')
+    conn.commit()
 
 
-def get_session() -> requests.Session:
-    if not getattr(tl, 'session', None):
-        tl.session = make_session()
-    return tl.session
+def stage_rows(conn: sqlite3.Connection, q: queue.Queue, failures: list[Exception]) -> None:
+    """Writer thread: drain fetched suras from q into the staging tables until None."""
+    cur = conn.cursor()
+    ayat_rows: list[tuple] = []
+    word_rows: list[tuple] = []
+
+    def flush() -> None:
+        cur.executemany(
+            'INSERT OR REPLACE INTO temp.stage_ayats VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)', ayat_rows)
+        cur.executemany('INSERT INTO temp.stage_words VALUES (?, ?, ?, ?, ?, ?, ?, ?)', word_rows)
+        conn.commit()
+        ayat_rows.clear()
+        word_rows.clear()
+
+    done = False
+    try:
+        for sura_ayats, sura_words in iter(q.get, None):
+            ayat_rows.extend(sura_ayats)
+            word_rows.extend(sura_words)
+            if len(word_rows) >= STAGE_BATCH:
+                flush()
+        done = True
+        flush()
+    except Exception as e:
+        failures.append(e)
+        # Keep draining so the fetchers never block on a full queue
+        if not done:
+            for _ in iter(q.get, None):
+                pass
+
+
+def insert_staged(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Assign ayat_id/word_id in (sura, ayah, word) order and move staged rows into place."""
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE temp.stage_ayats
+           SET ayat_id = o.rn
+          FROM (
+                SELECT rowid AS rid, ROW_NUMBER() OVER (ORDER BY sura_id, ayat_number) AS rn
+                FROM temp.stage_ayats
+          ) o
+         WHERE o.rid = stage_ayats.rowid
+    ''')
+    conn.commit()
+
+    # Single transaction for the whole bulk load
+    cur.execute('BEGIN IMMEDIATE')
+    cur.execute('''
+        INSERT INTO Ayats (
+            ayat_id, sura_id, ayat_number, text_uthmani, juz_id, hezb_id, page_id, sajdah_number, audio_url
+        )
+        SELECT ayat_id, sura_id, ayat_number, text_uthmani, juz_id, hezb_id, page_id, sajdah_number, audio_url
+        FROM temp.stage_ayats
+        ORDER BY ayat_id
+    ''')
+    ayat_count = cur.rowcount
+    cur.execute('''
+        INSERT INTO Words (
+            word_id, ayat_id, word_number, text_uthmani, type, page_number, line_number, audio_url
+        )
+        SELECT ROW_NUMBER() OVER (ORDER BY a.ayat_id, w.rowid), a.ayat_id, w.word_number,
+               w.text_uthmani, w.type, w.page_number, w.line_number, w.audio_url
+        FROM temp.stage_words w
+        JOIN temp.stage_ayats a ON a.sura_id = w.sura_id AND a.ayat_number = w.ayat_number
+        ORDER BY a.ayat_id, w.rowid
+    ''')
+    word_count = cur.rowcount
+    conn.commit()
+
+    cur.execute('DROP TABLE temp.stage_words')
+    cur.execute('DROP TABLE temp.stage_ayats')
+    return ayat_count, word_count
 
 
-API_BASE = 'https://api.quran.com/api/v4/verses/by_key/'
+CHAPTERS_URL = 'https://api.quran.com/api/v4/chapters?language=ar'
+API_BASE = 'https://api.quran.com/api/v4/verses/by_chapter/'
+# Largest page size the API accepts
+PER_PAGE = 50
 # Include needed fields for schema
 FIELDS = 'text_uthmani,chapter_id,page_number,juz_number,hizb_number,sajdah_number'
 WORD_FIELDS = 'text_uthmani,page_number,line_number,char_type,audio'
 
 
-def fetch_verse(sura_id: int, ayah_number: int):
-    session = get_session()
-    url = (
-        f"{API_BASE}{sura_id}:{ayah_number}?words=true&audio=7"
-        f"&word_fields={WORD_FIELDS}"
-        f"&fields={FIELDS}"
-    )
-    resp = session.get(url, timeout=(10, 60))
-    resp.raise_for_status()
-    verse = resp.json()['verse']
-    # Normalize payload to our schema
+def normalize_verse(sura_id: int, verse: dict) -> tuple[tuple, list[tuple]]:
+    """Flatten a verse into (ayat_row, word_rows) in stage_ayats/stage_words column order."""
+    sura_id = verse.get('chapter_id') or sura_id
+    ayah_number = verse.get('verse_number') or int(verse['verse_key'].split(':')[1])
     audio_url = None
     if verse.get('audio'):
         audio_url = combine_url(verse['audio'].get('url'))
 
-    words = []
-    for w in verse.get('words', []):
-        words.append({
-            'position': w.get('position'),
-            'text_uthmani': w.get('text_uthmani'),
-            'type': w.get('char_type_name') or w.get('char_type') or '',
-            'page_number': w.get('page_number'),
-            'line_number': w.get('line_number'),
-            'audio_url': combine_url(w.get('audio_url') or (w.get('audio') or {}).get('url')),
-        })
-
-    payload = {
-        'sura_id': verse.get('chapter_id'),
-        'ayat_number': verse.get('verse_number') or ayah_number,
-        'text_uthmani': verse.get('text_uthmani') or '',
-        'juz_id': verse.get('juz_number'),
-        'hezb_id': verse.get('hizb_number') or verse.get('rub_el_hizb_number'),
-        'page_id': verse.get('page_number'),
-        'sajdah_number': verse.get('sajdah_number'),
-    'audio_url': audio_url,
-        'words': words,
-    }
-    return (sura_id, ayah_number), payload
+    ayat_row = (
+        sura_id,
+        ayah_number,
+        verse.get('text_uthmani') or '',
+        verse.get('juz_number'),
+        verse.get('hizb_number') or verse.get('rub_el_hizb_number'),
+        verse.get('page_number'),
+        verse.get('sajdah_number'),
+        audio_url,
+    )
+    word_rows = [(
+        sura_id,
+        ayah_number,
+        w.get('position'),
+        w.get('text_uthmani') or '',
+        w.get('char_type_name') or w.get('char_type') or '',
+        w.get('page_number'),
+        w.get('line_number'),
+        combine_url(w.get('audio_url') or (w.get('audio') or {}).get('url')),
+    ) for w in verse.get('words', [])]
+    return ayat_row, word_rows
+
+
+async def fetch_chapter(client: httpx.AsyncClient, sura_id: int) -> tuple[list[tuple], list[tuple]]:
+    """Fetch every verse of a sura, walking the API's pagination. Returns (ayat_rows, word_rows)."""
+    ayat_rows: list[tuple] = []
+    word_rows: list[tuple] = []
+    page = 1
+    while page:
+        url = (
+            f"{API_BASE}{sura_id}?words=true&audio=7"
+            f"&per_page={PER_PAGE}&page={page}"
+            f"&word_fields={WORD_FIELDS}"
+            f"&fields={FIELDS}"
+        )
+        data = await get_json(client, url)
+        for verse in data['verses']:
+            ayat_row, words = normalize_verse(sura_id, verse)
+            ayat_rows.append(ayat_row)
+            word_rows.extend(words)
+        page = (data.get('pagination') or {}).get('next_page')
+    return ayat_rows, word_rows
+
+
+async def fetch_chapters() -> list[dict]:
+    async with make_client(max_connections=1) as client:
+        return (await get_json(client, CHAPTERS_URL))['chapters']
+
+
+async def fetch_verses(sura_ids: list[int], concurrency: int, q: queue.Queue) -> None:
+    """Fetch suras concurrently, handing each completed sura to the writer via q."""
+    errors: list[tuple[int, str]] = []
+    sem = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async with make_client() as client:
+        async def worker(sid: int) -> None:
+            nonlocal completed
+            async with sem:
+                try:
+                    rows = await fetch_chapter(client, sid)
+                except Exception as e:
+                    errors.append((sid, str(e)))
+                else:
+                    await asyncio.to_thread(q.put, rows)
+            completed += 1
+            if completed % 20 == 0:
+                print(f"Fetched {completed}/{len(sura_ids)} suras")
+
+        await asyncio.gather(*(worker(sid) for sid in sura_ids))
+
+        if errors:
+            print(f"{len(errors)} errors during fetch; retrying serially...")
+            for sid, _ in errors:
+                try:
+                    rows = await fetch_chapter(client, sid)
+                except Exception as e:
+                    print(f"Failed final fetch of sura {sid} -> {e}")
+                else:
+                    await asyncio.to_thread(q.put, rows)
 
 
 def main() -> None:
-    conn = sqlite3.connect(DB_PATH)
+    # The writer thread uses this connection while the main thread only waits on the fetch
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     ensure_base_tables(conn)
+    # No autocheckpoints or FK checks during the bulk load; checkpoint once at the end
+    conn.execute('PRAGMA wal_autocheckpoint=0')
+    conn.execute('PRAGMA foreign_keys=OFF')
 
     # Ensure static tables are populated
     cur = conn.cursor()
-    for juz_num in range(1, 31):
-        cur.execute(
-            'INSERT OR IGNORE INTO Juzs (juz_id, juz_number) VALUES (?, ?)', (juz_num, juz_num))
-    for hezb_num in range(1, 61):
-        juz_id = ((hezb_num - 1) // 2) + 1
-        cur.execute('INSERT OR IGNORE INTO Hezbs (hezb_id, hezb_number, juz_id) VALUES (?, ?, ?)',
-                    (hezb_num, hezb_num, juz_id))
-    for page_num in range(1, 605):
-        cur.execute(
-            'INSERT OR IGNORE INTO Pages (page_id, page_number) VALUES (?, ?)', (page_num, page_num))
+    cur.execute('''
+        WITH RECURSIVE seq(n) AS (VALUES(1) UNION ALL SELECT n + 1 FROM seq WHERE n < 30)
+        INSERT OR IGNORE INTO Juzs (juz_id, juz_number) SELECT n, n FROM seq
+    ''')
+    # Hezbs 1-2 in Juz 1, 3-4 in Juz 2, etc.
+    cur.execute('''
+        WITH RECURSIVE seq(n) AS (VALUES(1) UNION ALL SELECT n + 1 FROM seq WHERE n < 60)
+        INSERT OR IGNORE INTO Hezbs (hezb_id, hezb_number, juz_id) SELECT n, n, (n - 1) / 2 + 1 FROM seq
+    ''')
+    cur.execute('''
+        WITH RECURSIVE seq(n) AS (VALUES(1) UNION ALL SELECT n + 1 FROM seq WHERE n < 604)
+        INSERT OR IGNORE INTO Pages (page_id, page_number) SELECT n, n FROM seq
+    ''')
     conn.commit()
 
     recreate_ayats_words(conn)
 
     # Get sura metadata for counts
-    s = make_session()
-    suras_resp = s.get(
-        'https://api.quran.com/api/v4/chapters?language=ar', timeout=(10, 30))
-    suras_resp.raise_for_status()
-    suras = suras_resp.json()['chapters']
+    suras = asyncio.run(fetch_chapters())
     # Populate Suras table if needed
     for sura in suras:
         cur.execute('''
@@ -211,99 +416,51 @@ def main() -> None:
         ''', (sura['id'], sura['name_arabic'], sura['revelation_order'], sura['verses_count']))
     conn.commit()
 
-    # Build list of all ayah keys
-    all_ayah = []
-    for sura in suras:
-        sid = sura['id']
-        for anum in range(1, sura['verses_count'] + 1):
-            all_ayah.append((sid, anum))
-
-    print(f"Fetching {len(all_ayah)} verses with audio and word metadata...")
+    total_ayahs = sum(sura['verses_count'] for sura in suras)
+    print(f"Fetching {total_ayahs} verses from {len(suras)} suras with audio and word metadata...")
 
+    # Number of suras fetched concurrently over the HTTP/2 connections
     max_workers_env = os.getenv('QURAN_MAX_WORKERS')
     if max_workers_env and max_workers_env.isdigit():
         max_workers = int(max_workers_env)
     else:
-        cpu = os.cpu_count() or 4
-        max_workers = min(32, cpu * 4)
+        max_workers = 16
 
-    results: dict[tuple[int, int], dict] = {}
-    errors: list[tuple[tuple[int, int], str]] = []
+    # Overlap network and inserts: fetched suras are staged by a writer thread
+    create_staging_tables(conn)
+    q: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    failures: list[Exception] = []
+    writer = threading.Thread(target=stage_rows, args=(conn, q, failures), name='writer')
 
     start = time.time()
-    with ThreadPoolExecutor(max_workers=max_workers) as exe:
-        futs = {exe.submit(fetch_verse, sid, anum): (sid, anum)
-                for sid, anum in all_ayah}
-        completed = 0
-        for fut in as_completed(futs):
-            key = futs[fut]
-            try:
-                k, payload = fut.result()
-                results[k] = payload
-            except Exception as e:
-                errors.append((key, str(e)))
-            completed += 1
-            if completed % 200 == 0:
-                print(f"Fetched {completed}/{len(all_ayah)}")
-
-    if errors:
-        print(f"{len(errors)} errors during fetch; retrying serially...")
-        for key, _ in errors:
-            sid, anum = key
-            try:
-                k, payload = fetch_verse(sid, anum)
-                results[k] = payload
-            except Exception as e:
-                print(f"Failed final fetch {sid}:{anum} -> {e}")
-
-    print("Inserting into database...")
-
-    # Insert in deterministic order
-    ayat_id = 1
-    word_id = 1
+    writer.start()
+    try:
+        asyncio.run(fetch_verses([sura['id'] for sura in suras], max_workers, q))
+    finally:
+        q.put(None)
+        writer.join()
+    if failures:
+        raise failures[0]
+
+    cur.execute('SELECT sura_id, ayat_number FROM temp.stage_ayats')
+    staged = frozenset(cur)
     for sura in suras:
         sid = sura['id']
         for anum in range(1, sura['verses_count'] + 1):
-            payload = results.get((sid, anum))
-            if not payload:
+            if (sid, anum) not in staged:
                 print(f"Missing {sid}:{anum}")
-                continue
-            cur.execute('''
-                INSERT INTO Ayats (
-                    ayat_id, sura_id, ayat_number, text_uthmani, juz_id, hezb_id, page_id, sajdah_number, audio_url
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                ayat_id,
-                payload['sura_id'],
-                payload['ayat_number'],
-                payload['text_uthmani'],
-                payload['juz_id'],
-                payload['hezb_id'],
-                payload['page_id'],
-                payload['sajdah_number'],
-                payload['audio_url'],
-            ))
-            for w in payload['words']:
-                cur.execute('''
-                    INSERT INTO Words (
-                        word_id, ayat_id, word_number, text_uthmani, type, page_number, line_number, audio_url
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    word_id,
-                    ayat_id,
-                    w['position'],
-                    w['text_uthmani'] or '',
-                    w['type'] or '',
-                    w['page_number'],
-                    w['line_number'],
-                    w['audio_url'],
-                ))
-                word_id += 1
-            ayat_id += 1
+
+    print("Inserting into database...")
+    ayat_total, word_total = insert_staged(conn)
+    create_ayats_words_indexes(conn)
+    # Populate sqlite_stat tables for the query planner
+    cur.execute('ANALYZE')
     conn.commit()
+    conn.execute('PRAGMA foreign_keys=ON')
+    cur.execute('PRAGMA wal_checkpoint(TRUNCATE)')
 
     print(
-        f"Done. Inserted {ayat_id - 1} ayats and {word_id - 1} words in {time.time() - start:.1f}s")
+        f"Done. Inserted {ayat_total} ayats and {word_total} words in {time.time() - start:.1f}s")
 
     conn.close()
 
@@ -1,6 +1,6 @@
 import os
 import sqlite3
-from typing import Tuple, Set
+from typing import Dict, Tuple
 
 TARGET_DB = 'quran_arabic.db'
 SOURCE_DB = 'quran-metadata-juz.sqlite'
@@ -8,16 +8,23 @@ SOURCE_DB = 'quran-metadata-juz.sqlite'
 
 def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
     cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info({table})")
-    cols = {row[1] for row in cur.fetchall()}
-    return column in cols
+    cur.execute('SELECT 1 FROM pragma_table_info(?) WHERE name = ? LIMIT 1', (table, column))
+    return cur.fetchone() is not None
 
 
-def ensure_schema(conn: sqlite3.Connection) -> None:
+def configure_pragmas(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
-    # Performance and integrity
     cur.execute('PRAGMA journal_mode=WAL')
     cur.execute('PRAGMA synchronous=NORMAL')
+    cur.execute('PRAGMA temp_store=MEMORY')
+    cur.execute('PRAGMA cache_size=-100000')  # ~100MB cache
+    cur.execute('PRAGMA mmap_size=1073741824')  # map up to 1GB
+    cur.execute('PRAGMA busy_timeout=5000')
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    # Integrity
     cur.execute('PRAGMA foreign_keys=ON')
 
     # Ensure columns on Juzs
@@ -28,18 +35,13 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
     if not column_exists(conn, 'Juzs', 'last_ayat_id'):
         cur.execute('ALTER TABLE Juzs ADD COLUMN last_ayat_id INTEGER')
 
-    # Helpful index for mapping (sura_id, ayat_number) -> ayat_id
+    # Helpful index for (sura_id, ayat_number) lookups by clients of the DB
     cur.execute(
         'CREATE INDEX IF NOT EXISTS idx_ayats_sura_number ON Ayats(sura_id, ayat_number)')
 
     conn.commit()
 
 
-def get_valid_ayats(conn: sqlite3.Connection) -> Set[Tuple[int, int]]:
-    # Not necessary to load all; we'll query per verse. Keep function in case of future optimization.
-    return set()
-
-
 def parse_verse_key(key: str) -> Tuple[int, int]:
     # format like '2:142'
     parts = key.split(':')
@@ -48,14 +50,11 @@ def parse_verse_key(key: str) -> Tuple[int, int]:
     return int(parts[0]), int(parts[1])
 
 
-def map_to_ayat_id(conn: sqlite3.Connection, sura_id: int, ayat_number: int) -> int:
+def load_ayat_ids(conn: sqlite3.Connection) -> Dict[Tuple[int, int], int]:
+    """Return mapping of (sura_id, ayat_number) -> ayat_id for all ayats."""
     cur = conn.cursor()
-    cur.execute('SELECT ayat_id FROM Ayats WHERE sura_id=? AND ayat_number=? LIMIT 1',
-                (sura_id, ayat_number))
-    row = cur.fetchone()
-    if not row:
-        raise LookupError(f'Ayat not found for {sura_id}:{ayat_number}')
-    return row[0]
+    cur.execute('SELECT sura_id, ayat_number, ayat_id FROM Ayats')
+    return {(sura_id, ayat_number): ayat_id for sura_id, ayat_number, ayat_id in cur}
 
 
 def import_juzs() -> None:
@@ -67,36 +66,46 @@ def import_juzs() -> None:
         return
 
     tgt = sqlite3.connect(TARGET_DB)
+    configure_pragmas(tgt)
     ensure_schema(tgt)
+    ayat_ids = load_ayat_ids(tgt)
 
-    src = sqlite3.connect('file:' + SOURCE_DB + '?mode=ro', uri=True)
+    # Source is a static seed file: immutable skips locking and change detection
+    src = sqlite3.connect(f'file:{SOURCE_DB}?mode=ro&immutable=1', uri=True)
     scur = src.cursor()
 
     scur.execute(
         'SELECT juz_number, verses_count, first_verse_key, last_verse_key FROM juz ORDER BY juz_number')
 
     tcur = tgt.cursor()
-    updated = 0
+    updates = []
     skipped = 0
 
-    for juz_number, verses_count, first_key, last_key in scur.fetchall():
+    for juz_number, verses_count, first_key, last_key in scur:
         try:
             f_sura, f_ayah = parse_verse_key(first_key)
             l_sura, l_ayah = parse_verse_key(last_key)
-            first_id = map_to_ayat_id(tgt, f_sura, f_ayah)
-            last_id = map_to_ayat_id(tgt, l_sura, l_ayah)
-
-            # Update by juz_id (which equals juz_number in this DB)
-            tcur.execute('''
-                UPDATE Juzs
-                   SET verses_count = ?, first_ayat_id = ?, last_ayat_id = ?
-                 WHERE juz_id = ?
-            ''', (verses_count, first_id, last_id, juz_number))
-            updated += 1
+            first_id = ayat_ids.get((f_sura, f_ayah))
+            if first_id is None:
+                raise LookupError(f'Ayat not found for {f_sura}:{f_ayah}')
+            last_id = ayat_ids.get((l_sura, l_ayah))
+            if last_id is None:
+                raise LookupError(f'Ayat not found for {l_sura}:{l_ayah}')
+            updates.append((verses_count, first_id, last_id, juz_number))
         except Exception as e:
             print(f"Skip Juz {juz_number}: {e}")
             skipped += 1
 
+    # Update by juz_id (which equals juz_number in this DB)
+    tcur.executemany('''
+        UPDATE Juzs
+           SET verses_count = ?, first_ayat_id = ?, last_ayat_id = ?
+         WHERE juz_id = ?
+    ''', updates)
+    updated = len(updates)
+
+    # Refresh planner statistics (covers idx_ayats_sura_number)
+    tcur.execute('ANALYZE')
     tgt.commit()
 
     print(f"Juzs updated: {updated}, skipped: {skipped}")
@@ -23,8 +23,8 @@ CREATE TABLE Ayats_new (
 
 def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
     cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info({table})")
-    return any(row[1] == column for row in cur.fetchall())
+    cur.execute('SELECT 1 FROM pragma_table_info(?) WHERE name = ? LIMIT 1', (table, column))
+    return cur.fetchone() is not None
 
 
 def drop_audio_segments() -> None:
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import sys
+from typing import Iterable
+
+import update_pages_for_juz_hezb
+import update_suras_page_line
+
+DB_PATH = 'quran_arabic.db'
+
+# Step name -> module exposing ensure_columns(conn), update_statements(conn)
+# and report(conn), in run order
+STEPS = {
+    'juz_hezb_pages': update_pages_for_juz_hezb,
+    'suras_page_line': update_suras_page_line,
+}
+
+
+def configure_pragmas(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    # One-shot build steps, not a live DB: in-memory journal and no fsync. A failed
+    # UPDATE still rolls back the batch, but a crash mid-write can leave the DB
+    # inconsistent; the remedy is to rerun the pipeline. WAL is restored on close.
+    cur.execute('PRAGMA journal_mode=MEMORY')
+    cur.execute('PRAGMA synchronous=OFF')
+    cur.execute('PRAGMA cache_size=-200000')
+    cur.execute('PRAGMA mmap_size=268435456')
+    cur.execute('PRAGMA foreign_keys=ON')
+
+
+def run_pipeline(steps: Iterable[str] = tuple(STEPS)) -> None:
+    """Run the given update steps against one shared connection."""
+    if not os.path.exists(DB_PATH):
+        print(f"DB not found: {DB_PATH}")
+        return
+
+    steps = list(steps)
+    unknown = [name for name in steps if name not in STEPS]
+    if unknown:
+        sys.exit(f"Unknown step(s): {', '.join(unknown)}. Available: {', '.join(STEPS)}")
+    modules = [STEPS[name] for name in steps]
+
+    # Autocommit mode: the UPDATEs below run in one explicit transaction
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, cached_statements=512)
+    configure_pragmas(conn)
+    try:
+        for module in modules:
+            module.ensure_columns(conn)
+
+        statements = [sql for module in modules for sql in module.update_statements(conn)]
+        script = 'BEGIN IMMEDIATE;\n' + ';\n'.join(statements) + ';\nCOMMIT;'
+        try:
+            conn.executescript(script)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+        for module in modules:
+            module.report(conn)
+    finally:
+        # journal_mode is persistent: hand the working DB back in WAL mode
+        conn.execute('PRAGMA main.journal_mode=WAL')
+        conn.close()
+
+
+if __name__ == '__main__':
+    run_pipeline(sys.argv[1:] or tuple(STEPS))
@@ -1,7 +1,6 @@
 import os
 import json
 import time
-import threading
 import requests
 import sqlite3
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -20,7 +19,15 @@ def combine_url(path: str | None) -> str | None:
     return BASE_AUDIO.rstrip('/') + '/' + path.lstrip('/')
 
 
-def make_session() -> requests.Session:
+def get_max_workers() -> int:
+    max_workers_env = os.getenv('QURAN_MAX_WORKERS')
+    if max_workers_env and max_workers_env.isdigit():
+        return int(max_workers_env)
+    cpu = os.cpu_count() or 4
+    return min(32, cpu * 4)
+
+
+def make_session(pool_size: int) -> requests.Session:
     s = requests.Session()
     retry = Retry(
         total=5,
@@ -31,7 +38,7 @@ def make_session() -> requests.Session:
         allowed_methods=frozenset(["GET"]),
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retry, pool_connections=100, pool_maxsize=100)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
     s.mount('https://', adapter)
     s.mount('http://', adapter)
     s.headers.update({'User-Agent': 'QuranFetcher/2.0 (+https://api.quran.com)'})
@@ -113,20 +120,16 @@ def recreate_ayats_words(conn: sqlite3.Connection) -> None:
 
     # Indexes
     cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_sura ON Ayats(sura_id)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_juz ON Ayats(juz_id)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_hezb ON Ayats(hezb_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_juz_page ON Ayats(juz_id, page_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_hezb_page ON Ayats(hezb_id, page_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_ayat_page ON Ayats(page_id)')
     cur.execute('CREATE INDEX IF NOT EXISTS idx_word_ayat ON Words(ayat_id)')
     conn.commit()
 
 
-tl = threading.local()
-
-
-def get_session() -> requests.Session:
-    if not getattr(tl, 'session', None):
-        tl.session = make_session()
-    return tl.session
+MAX_WORKERS = get_max_workers()
+# One session shared by all workers: a single pool, so keep-alive connections are reused
+SESSION = make_session(MAX_WORKERS)
 
 
 API_BASE = 'https://api.quran.com/api/v4/verses/by_key/'
@@ -136,13 +139,12 @@ WORD_FIELDS = 'text_uthmani,page_number,line_number,char_type,audio'
 
 
 def fetch_verse(sura_id: int, ayah_number: int):
-    session = get_session()
     url = (
         f"{API_BASE}{sura_id}:{ayah_number}?words=true&audio=7"
         f"&word_fields={WORD_FIELDS}"
         f"&fields={FIELDS}"
     )
-    resp = session.get(url, timeout=(10, 60))
+    resp = SESSION.get(url, timeout=(10, 60))
     resp.raise_for_status()
     verse = resp.json()['verse']
     # Normalize payload to our schema
@@ -193,8 +195,7 @@ def main() -> None:
     recreate_ayats_words(conn)
 
     # Get sura metadata for counts
-    s = make_session()
-    suras_resp = s.get('https://api.quran.com/api/v4/chapters?language=ar', timeout=(10, 30))
+    suras_resp = SESSION.get('https://api.quran.com/api/v4/chapters?language=ar', timeout=(10, 30))
     suras_resp.raise_for_status()
     suras = suras_resp.json()['chapters']
     # Populate Suras table if needed
@@ -214,18 +215,11 @@ def main() -> None:
 
     print(f"Fetching {len(all_ayah)} verses with audio and word metadata...")
 
-    max_workers_env = os.getenv('QURAN_MAX_WORKERS')
-    if max_workers_env and max_workers_env.isdigit():
-        max_workers = int(max_workers_env)
-    else:
-        cpu = os.cpu_count() or 4
-        max_workers = min(32, cpu * 4)
-
     results: dict[tuple[int, int], dict] = {}
     errors: list[tuple[tuple[int, int], str]] = []
 
     start = time.time()
-    with ThreadPoolExecutor(max_workers=max_workers) as exe:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as exe:
         futs = {exe.submit(fetch_verse, sid, anum): (sid, anum) for sid, anum in all_ayah}
         completed = 0
         for fut in as_completed(futs):
@@ -1,20 +1,59 @@
 import os
 import sqlite3
-from typing import List, Tuple, Dict
+from typing import Tuple
 
 TARGET_DB = 'quran_arabic.db'
 SOURCE_DB = 'uthmani-15-lines.db'
 
-
-def ensure_schema(conn: sqlite3.Connection) -> None:
+# (total, missing_page, missing_sura) for the attached src.pages
+COUNT_SOURCE_SQL = '''
+    SELECT COUNT(*),
+           COALESCE(SUM(pg.page_id IS NULL), 0),
+           COALESCE(SUM(pg.page_id IS NOT NULL AND s.sura_id IS NULL), 0)
+    FROM src.pages p
+    LEFT JOIN Pages pg ON pg.page_number = p.page_number
+    LEFT JOIN Suras s ON s.sura_id = p.surah_number
+'''
+
+# Copy src.pages into Lines: rows without a known page or sura are skipped
+INSERT_LINES_SQL = '''
+    INSERT INTO Lines (page_id, line_number, line_type, is_centered, first_word_id, last_word_id, sura_id)
+    SELECT pg.page_id, p.line_number, p.line_type,
+           COALESCE(p.is_centered, 0) <> 0,
+           p.first_word_id, p.last_word_id, s.sura_id
+    FROM src.pages p
+    -- CROSS JOINs pin the order: most source rows carry no sura,
+    -- so reject them on the Suras PK before probing Pages
+    CROSS JOIN Suras s ON s.sura_id = p.surah_number
+    CROSS JOIN Pages pg ON pg.page_number = p.page_number
+    -- Insert in (page_id, line_number) order so rowids follow the page layout
+    -- and the index builds afterwards read already-clustered rows
+    ORDER BY pg.page_id, p.line_number
+'''
+
+
+def configure_pragmas(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
-    # Performance / integrity pragmas
-    cur.execute('PRAGMA journal_mode=WAL')
-    cur.execute('PRAGMA foreign_keys=ON')
+    # One-shot build script, not a live DB: trade durability for bulk-load speed.
+    # The rollback journal is kept in memory, so ROLLBACK still works (a duplicate
+    # source line undoes the rebuild), but a crash mid-write can leave the DB
+    # inconsistent; the remedy is to rerun the script. WAL is restored on close.
+    # Set before rebuild_lines: journal_mode cannot change inside a transaction.
+    cur.executescript('''
+        PRAGMA journal_mode=MEMORY;
+        PRAGMA synchronous=OFF;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-200000;
+        PRAGMA mmap_size=268435456;
+        PRAGMA locking_mode=EXCLUSIVE;
+        PRAGMA foreign_keys=ON;
+    ''')
+
 
-    # Lines table
+def create_lines_table(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
     cur.execute('''
-    CREATE TABLE IF NOT EXISTS Lines (
+    CREATE TABLE Lines (
         line_id INTEGER PRIMARY KEY,
         page_id INTEGER NOT NULL,
         line_number INTEGER NOT NULL,
@@ -27,31 +66,46 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
         FOREIGN KEY (sura_id) REFERENCES Suras(sura_id)
     )
     ''')
-    # Indexes / constraints
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_lines_page ON Lines(page_id)')
-    cur.execute('CREATE INDEX IF NOT EXISTS idx_lines_sura ON Lines(sura_id)')
-    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_lines_page_line ON Lines(page_id, line_number)')
-    conn.commit()
 
 
-def load_source_rows(src_conn: sqlite3.Connection) -> List[Tuple[int, int, str, int, int, int, int]]:
-    cur = src_conn.cursor()
-    cur.execute('''
-        SELECT page_number, line_number, line_type, is_centered, first_word_id, last_word_id, surah_number
-        FROM pages
-        ORDER BY page_number, line_number
-    ''')
-    return cur.fetchall()
+def create_lines_indexes(conn: sqlite3.Connection) -> None:
+    """Build Lines indexes once the bulk insert is done."""
+    cur = conn.cursor()
+    # A duplicate (page_id, line_number) in the source fails here with IntegrityError
+    cur.execute('CREATE UNIQUE INDEX uq_lines_page_line ON Lines(page_id, line_number)')
+    # page_id lookups use uq_lines_page_line; sura_id lookups use this composite,
+    # which update_suras_page_line.py also relies on
+    cur.execute('CREATE INDEX idx_lines_sura_page_line ON Lines(sura_id, page_id, line_number)')
+
+
+def count_source_rows(conn: sqlite3.Connection) -> Tuple[int, int, int]:
+    """Return (total, missing_page, missing_sura) for the attached src.pages."""
+    cur = conn.cursor()
+    cur.execute(COUNT_SOURCE_SQL)
+    return cur.fetchone()
+
 
+def rebuild_lines(conn: sqlite3.Connection) -> int:
+    """Replace Lines with src.pages, mapping page_number to Pages.page_id.
 
-def get_page_map_and_valid_suras(conn: sqlite3.Connection) -> Tuple[Dict[int, int], set]:
-    """Return mapping of page_number -> page_id and set of valid sura_ids."""
+    Rows without a known page or sura are skipped. The DROP, CREATE, INSERT and
+    index builds share one transaction, so any failure (e.g. a duplicate
+    (page_id, line_number) in the source) leaves the previous Lines intact.
+    Returns the number of inserted rows.
+    """
     cur = conn.cursor()
-    cur.execute('SELECT page_id, page_number FROM Pages')
-    page_map = {row[1]: row[0] for row in cur.fetchall()}
-    cur.execute('SELECT sura_id FROM Suras')
-    valid_suras = {row[0] for row in cur.fetchall()}
-    return page_map, valid_suras
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        cur.execute('DROP TABLE IF EXISTS Lines')
+        create_lines_table(conn)
+        cur.execute(INSERT_LINES_SQL)
+        inserted = cur.rowcount
+        create_lines_indexes(conn)
+        cur.execute('COMMIT')
+    except Exception:
+        cur.execute('ROLLBACK')
+        raise
+    return inserted
 
 
 def import_lines() -> None:
@@ -62,56 +116,30 @@ def import_lines() -> None:
         print(f"Target DB not found: {TARGET_DB}")
         return
 
-    tgt = sqlite3.connect(TARGET_DB)
-    # delete existing lines
-    tgt.execute('DELETE FROM Lines')
-    # delete the lines table if exists
-    tgt.execute('DROP TABLE IF EXISTS Lines')
-    
-    ensure_schema(tgt)
-
-    src = sqlite3.connect('file:' + SOURCE_DB + '?mode=ro', uri=True)
-
-    rows = load_source_rows(src)
-    print(f"Loaded {len(rows)} lines from source")
-
-    page_map, valid_suras = get_page_map_and_valid_suras(tgt)
-    missing_page = 0
-    missing_sura = 0
-
-    to_insert = []
-    for page_number, line_number, line_type, is_centered, first_word_id, last_word_id, surah_number in rows:
-        page_id = page_map.get(page_number)
-        sura_id = surah_number
-        if page_id is None:
-            missing_page += 1
-            continue
-        if sura_id not in valid_suras:
-            missing_sura += 1
-            continue
-        to_insert.append((
-            page_id,
-            line_number,
-            line_type,
-            1 if int(is_centered or 0) != 0 else 0,
-            first_word_id,
-            last_word_id,
-            sura_id,
-        ))
-
-    cur = tgt.cursor()
-    cur.executemany('''INSERT OR IGNORE INTO Lines (page_id, line_number, line_type, is_centered, first_word_id, last_word_id, sura_id) VALUES (?, ?, ?, ?, ?, ?, ?)''', to_insert)
-    tgt.commit()
-
-    print(f"Inserted {cur.rowcount if hasattr(cur, 'rowcount') else len(to_insert)} lines (attempted). Skipped {missing_page} due to missing pages and {missing_sura} due to missing suras.")
-
-    # Show totals
-    cur.execute('SELECT COUNT(*) FROM Lines')
-    total = cur.fetchone()[0]
-    print(f"Lines total now: {total}")
-
-    src.close()
-    tgt.close()
+    # Autocommit mode: the rebuild runs in its own explicit transaction
+    tgt = sqlite3.connect(TARGET_DB, uri=True, isolation_level=None, cached_statements=512)
+    configure_pragmas(tgt)
+    try:
+        # ATTACH is not allowed inside a transaction, so it precedes rebuild_lines
+        tgt.execute('ATTACH DATABASE ? AS src', ('file:' + SOURCE_DB + '?mode=ro',))
+        tgt.execute('PRAGMA src.mmap_size=268435456')
+        total, missing_page, missing_sura = count_source_rows(tgt)
+        print(f"Loaded {total} lines from source")
+
+        inserted = rebuild_lines(tgt)
+        tgt.execute('DETACH DATABASE src')
+
+        print(f"Inserted {inserted} lines. Skipped {missing_page} due to missing pages and {missing_sura} due to missing suras.")
+
+        # Show totals
+        cur = tgt.cursor()
+        cur.execute('SELECT COUNT(*) FROM Lines')
+        total = cur.fetchone()[0]
+        print(f"Lines total now: {total}")
+    finally:
+        # journal_mode is persistent: hand the working DB back in WAL mode
+        tgt.execute('PRAGMA main.journal_mode=WAL')
+        tgt.close()
 
 
 if __name__ == '__main__':
@@ -1,81 +1,65 @@
-import os
 import sqlite3
+from typing import List
 
-DB_PATH = 'quran_arabic.db'
+# Min page_id per juz_id / hezb_id from Ayats
+JUZ_PAGES_SQL = '''
+    UPDATE Juzs
+       SET page_number = mp.min_page
+      FROM (
+            SELECT juz_id, MIN(page_id) AS min_page
+            FROM Ayats
+            GROUP BY juz_id
+      ) mp
+     WHERE mp.juz_id = Juzs.juz_id
+'''
+
+HEZB_PAGES_SQL = '''
+    UPDATE Hezbs
+       SET page_number = mp.min_page
+      FROM (
+            SELECT hezb_id, MIN(page_id) AS min_page
+            FROM Ayats
+            GROUP BY hezb_id
+      ) mp
+     WHERE mp.hezb_id = Hezbs.hezb_id
+'''
 
 
 def column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
     cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info({table})")
-    return any(row[1] == column for row in cur.fetchall())
+    cur.execute('SELECT 1 FROM pragma_table_info(?) WHERE name = ? LIMIT 1', (table, column))
+    return cur.fetchone() is not None
 
 
 def ensure_columns(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
-    # Performance / integrity
-    cur.execute('PRAGMA journal_mode=WAL')
-    cur.execute('PRAGMA synchronous=NORMAL')
-    cur.execute('PRAGMA foreign_keys=ON')
-
     # Add page_number column to Juzs and Hezbs if missing
     if not column_exists(conn, 'Juzs', 'page_number'):
         cur.execute('ALTER TABLE Juzs ADD COLUMN page_number INTEGER')
     if not column_exists(conn, 'Hezbs', 'page_number'):
         cur.execute('ALTER TABLE Hezbs ADD COLUMN page_number INTEGER')
+    # Covering indexes so MIN(page_id) per juz/hezb is an index-only lookup
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_juz_page ON Ayats(juz_id, page_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ayats_hezb_page ON Ayats(hezb_id, page_id)')
+    # Migration: DBs from older downloaders carry single-column prefixes of these
+    cur.execute('DROP INDEX IF EXISTS idx_ayat_juz')
+    cur.execute('DROP INDEX IF EXISTS idx_ayat_hezb')
     conn.commit()
 
 
-def update_juz_pages(conn: sqlite3.Connection) -> int:
-    cur = conn.cursor()
-    # Compute min page_id per juz_id from Ayats
-    cur.execute('''
-        WITH min_pages AS (
-            SELECT juz_id, MIN(page_id) AS min_page
-            FROM Ayats
-            GROUP BY juz_id
-        )
-        UPDATE Juzs
-           SET page_number = (
-                SELECT min_page FROM min_pages WHERE min_pages.juz_id = Juzs.juz_id
-           )
-    ''')
-    conn.commit()
-    # Count populated rows
-    cur.execute('SELECT COUNT(*) FROM Juzs WHERE page_number IS NOT NULL')
-    return cur.fetchone()[0]
+def update_statements(conn: sqlite3.Connection) -> List[str]:
+    """Return the UPDATEs for this step; the caller runs them in its transaction."""
+    return [JUZ_PAGES_SQL, HEZB_PAGES_SQL]
 
 
-def update_hezb_pages(conn: sqlite3.Connection) -> int:
+def report(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
-    cur.execute('''
-        WITH min_pages AS (
-            SELECT hezb_id, MIN(page_id) AS min_page
-            FROM Ayats
-            GROUP BY hezb_id
-        )
-        UPDATE Hezbs
-           SET page_number = (
-                SELECT min_page FROM min_pages WHERE min_pages.hezb_id = Hezbs.hezb_id
-           )
-    ''')
-    conn.commit()
+    cur.execute('SELECT COUNT(*) FROM Juzs WHERE page_number IS NOT NULL')
+    juz_filled = cur.fetchone()[0]
     cur.execute('SELECT COUNT(*) FROM Hezbs WHERE page_number IS NOT NULL')
-    return cur.fetchone()[0]
-
-
-def main() -> None:
-    if not os.path.exists(DB_PATH):
-        print(f"DB not found: {DB_PATH}")
-        return
-
-    conn = sqlite3.connect(DB_PATH)
-    ensure_columns(conn)
-
-    juz_filled = update_juz_pages(conn)
-    hezb_filled = update_hezb_pages(conn)
+    hezb_filled = cur.fetchone()[0]
 
     # Show small sample
-    cur = conn.cursor()
     cur.execute(
         'SELECT juz_id, juz_number, page_number FROM Juzs ORDER BY juz_id LIMIT 5')
     juz_rows = cur.fetchall()
@@ -83,8 +67,6 @@ def main() -> None:
         'SELECT hezb_id, hezb_number, page_number FROM Hezbs ORDER BY hezb_id LIMIT 5')
     hezb_rows = cur.fetchall()
 
-    conn.close()
-
     print(f"Updated Juzs page_number for {juz_filled} rows")
     for r in juz_rows:
         print(r)
@@ -93,5 +75,11 @@ def main() -> None:
         print(r)
 
 
+def main() -> None:
+    # Local import avoids a circular import: run_pipeline imports this module
+    from run_pipeline import run_pipeline
+    run_pipeline(['juz_hezb_pages'])
+
+
 if __name__ == '__main__':
     main()